@@ -14,15 +14,32 @@ import numpy as np
 import matplotlib.pyplot as plt
 import micro2d as mi2d
 import image2d as im2d
+import functools
 import math
 import pylab
 from skimage import io
+from skimage import morphology
+from scipy.signal import fftconvolve
 import datetime
 import random
 import scipy
-from scipy.stats import gaussian_kde
 import colorsys
 
+# vectorized HSV->RGB converter : matplotlib's array implementation when available, otherwise batch colorsys through a ufunc (still one Python call per pixel but no interpreter loop)
+try:
+    from matplotlib.colors import hsv_to_rgb
+except ImportError:
+    _hsv2rgb_u=np.frompyfunc(colorsys.hsv_to_rgb, 3, 3)
+    def hsv_to_rgb(hsv):
+        r,g,b=_hsv2rgb_u(hsv[...,0],hsv[...,1],hsv[...,2])
+        return np.stack([np.float64(r),np.float64(g),np.float64(b)],axis=-1)
+
+# numba is optional : when it is available the per-pixel colormap gather of plot runs as a compiled parallel loop
+try:
+    import numba
+except ImportError:
+    numba=None
+
 class aita(object):
     '''
 	"aita" is a python class to analyse output from G50-AITA analyser.
@@ -67,16 +84,30 @@ class aita(object):
         self.phi=im2d.image2d(phi_field,resolution)
         self.qua=im2d.image2d(qua_field,resolution)
         
-        # create microstructure
+        # create microstructure ; the grain label map is build lazily (see the grains property)
         self.micro=mi2d.micro2d(micro_field,resolution)
-        self.grains=self.micro.grain_label()
-        
-        # replace grains boundary with NaN number
-        self.grains.field=np.array(self.grains.field,float)
-        idx=np.where(self.micro.field==1)
-        self.grains.field[idx]=np.nan
+        self._grains=None
+        self._grains_dirty=True
+
+        print ("Sucessfull aita build !")
+
+    @property
+    def grains(self):
+        '''
+        Grain label map with NaN on the boundary, rebuild from the microstructure only when the boundary topology changed
 
-        print ("Sucessfull aita build !")  
+        :return: grain label map
+        :rtype: image2d
+        '''
+        if self._grains_dirty:
+            self._grains=self.micro.grain_label(boundary_nan=True)
+            self._grains_dirty=False
+        return self._grains
+
+    @grains.setter
+    def grains(self,value):
+        self._grains=value
+        self._grains_dirty=False
         
     def crop(self):
         '''
@@ -112,12 +143,9 @@ class aita(object):
         self.phi1.field=self.phi1.field[ymin:ymax, xmin:xmax]
         self.qua.field=self.qua.field[ymin:ymax, xmin:xmax]
         self.micro.field=self.micro.field[ymin:ymax, xmin:xmax]
-        self.grains=self.micro.grain_label()
-        
-        # replace grains boundary with NaN number
-        self.grains.field=np.array(self.grains.field,float)
-        idx=np.where(self.micro.field==1)
-        self.grains.field[idx]=np.nan
+        # a crop keeps the labels valid : slice the label map instead of running a new labelling
+        if not self._grains_dirty:
+            self._grains.field=self._grains.field[ymin:ymax, xmin:xmax]
         
     def fliplr(self):
         '''
@@ -128,12 +156,18 @@ class aita(object):
         :Exemple: >>> data.fliplr()
         '''
         
-        # horizontal miror (fliplr) on all the data in self
-        self.phi.field=np.fliplr(self.phi.field)
-        self.phi1.field=np.mod(math.pi-np.fliplr(self.phi1.field),2*math.pi) # change phi1 angle by pi-phi1 modulo 2*pi
-        self.qua.field=np.fliplr(self.qua.field)
-        self.micro.field=np.fliplr(self.micro.field)
-        self.grains.field=np.fliplr(self.grains.field)
+        # horizontal miror (fliplr) on all the data in self, [:,::-1] is a free reversed-stride view
+        self.phi.field=self.phi.field[:,::-1]
+        self.qua.field=self.qua.field[:,::-1]
+        self.micro.field=self.micro.field[:,::-1]
+        # flip the label map only when it exists : a lazy rebuild would label the already-flipped microstructure
+        if not self._grains_dirty:
+            self._grains.field=self._grains.field[:,::-1]
+        # change phi1 angle by pi-phi1 modulo 2*pi, computed in place on one copy
+        tmp=self.phi1.field[:,::-1].copy()
+        np.subtract(math.pi,tmp,out=tmp)
+        np.mod(tmp,2*math.pi,out=tmp)
+        self.phi1.field=tmp
         
     def rot180(self):
         '''
@@ -144,12 +178,18 @@ class aita(object):
         :Exemple: >>> data.rot180()
         '''
         
-        # rotate the position of the data if 180 degre
-        self.phi.field=np.flipud(np.fliplr(self.phi.field))
-        self.phi1.field=np.mod(math.pi+np.flipud(np.fliplr(self.phi1.field)),2*math.pi) # rotate the c-axis : phi1 = pi + phi1 mod(2*pi)
-        self.qua.field=np.flipud(np.fliplr(self.qua.field))
-        self.micro.field=np.flipud(np.fliplr(self.micro.field))
-        self.grains.field=np.flipud(np.fliplr(self.grains.field))
+        # rotate the position of the data if 180 degre, [::-1,::-1] is a free reversed-stride view
+        self.phi.field=self.phi.field[::-1,::-1]
+        self.qua.field=self.qua.field[::-1,::-1]
+        self.micro.field=self.micro.field[::-1,::-1]
+        # rotate the label map only when it exists : a lazy rebuild would label the already-rotated microstructure
+        if not self._grains_dirty:
+            self._grains.field=self._grains.field[::-1,::-1]
+        # rotate the c-axis : phi1 = pi + phi1 mod(2*pi), computed in place on one copy
+        tmp=self.phi1.field[::-1,::-1].copy()
+        np.add(tmp,math.pi,out=tmp)
+        np.mod(tmp,2*math.pi,out=tmp)
+        self.phi1.field=tmp
         
     def filter(self,value):
         ''' 
@@ -176,13 +216,24 @@ class aita(object):
         '''
         # number of grain
         nb_grain=int(np.nanmax(self.grains.field))
-        # loop on all the grain
-        for i in list(xrange(nb_grain+1)):
-            # find the pixel inside the grain i
-            idx=np.where(self.grains.field==i)
-            # compute the mean value of phi1 and phi and replace the value in the map
-            self.phi.field[idx]=np.nanmean(self.phi.field[idx])
-            self.phi1.field[idx]=np.nanmean(self.phi1.field[idx])
+        # localized the pixel inside a grain (not a boundary)
+        gmask=~np.isnan(self.grains.field)
+        lab=np.int32(self.grains.field[gmask])
+        phi=self.phi.field[gmask]
+        phi1=self.phi1.field[gmask]
+        # compute the sum of phi and the number of valid pixel for each grain in one pass
+        vmask=~np.isnan(phi)
+        cnt=np.bincount(lab[vmask],minlength=nb_grain+1)
+        mean_phi=np.bincount(lab[vmask],weights=phi[vmask],minlength=nb_grain+1)/np.maximum(cnt,1)
+        mean_phi[cnt==0]=np.nan
+        # same for phi1
+        vmask1=~np.isnan(phi1)
+        cnt1=np.bincount(lab[vmask1],minlength=nb_grain+1)
+        mean_phi1=np.bincount(lab[vmask1],weights=phi1[vmask1],minlength=nb_grain+1)/np.maximum(cnt1,1)
+        mean_phi1[cnt1==0]=np.nan
+        # replace the value in the map by the mean orientation of the grain
+        self.phi.field[gmask]=mean_phi[lab]
+        self.phi1.field[gmask]=mean_phi1[lab]
         
     def imresize(self,res):
         '''
@@ -199,8 +250,15 @@ class aita(object):
         self.qua.imresize(res)
         self.grains.imresize(res)
         
-        # make larger the boundaries to keep them
-        self.micro.field=scipy.ndimage.binary_dilation(self.micro.field, iterations=np.int32(res/(2*self.micro.res)))
+        # make larger the boundaries to keep them (plain int for binary_dilation, at least one iteration)
+        n_iter=max(1,int(round(res/(2*self.micro.res))))
+        if n_iter>4:
+            # large dilation : one FFT convolution with a disk shaped element is much faster than n_iter iterated dilations
+            strel=morphology.disk(n_iter)
+            conv=fftconvolve(np.float32(self.micro.field),strel,mode='same')
+            self.micro.field=conv>0.5
+        else:
+            self.micro.field=scipy.ndimage.binary_dilation(self.micro.field, iterations=n_iter)
         # resize
         self.micro.imresize(res)
         
@@ -223,44 +281,32 @@ class aita(object):
         # remove the grain boundary (remove NaN value)
         ##############################################
         # find where are the NaN Value corresponding to the grain boundary
-        idx=np.where(np.isnan(self.grains.field))
-        # while NaN value are in the microstructure we replace by an other value ...
-        while np.size(idx)>0:
-            # for all the pixel NaN
-            for i in list(xrange(np.shape(idx)[1])):
-                # if the pixel is at the bottom line of the sample, we choose the pixel one line upper ...
-                if idx[0][i]==0:
-                    k=idx[0][i]+1
-                #... else we choose the pixel one line higher.
-                else:
-                    k=idx[0][i]-1
-                # if the pixel is at the left side of the sample, we choose the pixel at its right  ...
-                if idx[1][i]==0:
-                    kk=idx[1][i]+1
-                # else we choose the pixel at its left.
-                else:
-                    kk=idx[1][i]-1
-                # Replace the value by the value of the neighbor select just before
-                self.phi.field[idx[0][i], idx[1][i]]= self.phi.field[k, kk]
-                self.phi1.field[idx[0][i], idx[1][i]]= self.phi1.field[k, kk]
-                self.grains.field[idx[0][i], idx[1][i]]= self.grains.field[k, kk]
-                # re-evaluate if there is sill NaN value inside the microstructure
-            idx=np.where(np.isnan(self.grains.field))# re-evaluate the NaN
+        mask=np.isnan(self.grains.field)
+        # find for each NaN pixel the index of the closest pixel inside a grain
+        inds=scipy.ndimage.distance_transform_edt(mask,return_distances=False,return_indices=True)
+        # replace the value by the value of the closest pixel inside a grain
+        self.phi.field=self.phi.field[tuple(inds)]
+        self.phi1.field=self.phi1.field[tuple(inds)]
+        self.grains.field=self.grains.field[tuple(inds)]
+        # the filled map is NaN free : one local int32 copy serves the phase extraction and the VTK write, the shared map stays float for the isnan consumers
+        grains_int=np.int32(self.grains.field)
             
         # find the value of the orientation for each phase
-        phi1=[]
-        phi=[]
-        phi2=[]
-        for i in list(xrange(np.max(np.int32(self.grains.field)+1))):
-            idx=np.where(np.int32(self.grains.field)==i)
-            if np.size(idx)!=0:
-                phi1.append(self.phi1.field[idx[0][0]][idx[1][0]])
-                phi.append(self.phi.field[idx[0][0]][idx[1][0]])
-                phi2.append(random.random()*2*math.pi)
-            else:
-                phi1.append(np.nan)
-                phi.append(np.nan)
-                phi2.append(np.nan)
+        g=grains_int.ravel()
+        # find the first pixel of each grain label in one pass
+        labels,first_idx=np.unique(g,return_index=True)
+        nb_phase=np.max(g)+1
+        # missing labels keep a NaN orientation
+        phi1=np.empty(nb_phase, float)
+        phi1.fill(np.nan)
+        phi=np.empty(nb_phase, float)
+        phi.fill(np.nan)
+        phi2=np.empty(nb_phase, float)
+        phi2.fill(np.nan)
+        phi1[labels]=self.phi1.field.ravel()[first_idx]
+        phi[labels]=self.phi.field.ravel()[first_idx]
+        # draw all the random phi2 angle in one call
+        phi2[labels]=np.random.uniform(0,2*math.pi,size=np.size(labels))
         ################################   
         # Write the microstructure input
         ################################
@@ -279,12 +325,10 @@ class aita(object):
         micro_out.write('POINT_DATA ' + str(ss[0]*ss[1]) + '\n')
         micro_out.write('SCALARS scalars float \n')
         micro_out.write('LOOKUP_TABLE default \n')
-        for i in list(xrange(ss[0]))[::-1]:
-            for j in list(xrange(ss[1])):
-                micro_out.write(str(int(self.grains.field[i][j]))+' ')
-            micro_out.write('\n')        
+        # write all the grain label in one call, last line of the map first
+        np.savetxt(micro_out,np.flipud(grains_int),fmt='%d')
         micro_out.close()
-        ################################   
+        ################################
         ##### Write the phase input ####
         ################################
         phase_out=open(nameId+'.phase','w')
@@ -295,7 +339,7 @@ class aita(object):
         phase_out.write('#\n#------------------------------------------------------------\n')
         phase_out.write('# phase    material       phi1    Phi   phi2\n')
         phase_out.write('#------------------------------------------------------------\n')
-        for i in list(xrange(np.size(phi))):
+        for i in range(np.size(phi)):
             if 1-np.isnan(phi[i]):
                 phase_out.write(str(i) + '          0              ' + str(phi1[i]) + ' ' + str(phi[i]) + ' ' + str(phi2[i]) + '\n');  
         phase_out.close()
@@ -411,47 +455,45 @@ class aita(object):
                 # find the label of grain
                 label=self.grains.field[id[:,1],id[:,0]]
             else:
-                label=grainlist
-            tazi=[]
-            tcol=[]
-            for i in list(xrange(len(label))):
-                idx=np.where(self.grains.field==label[i])
-                tazi.append(list(np.mod(self.phi1.field[idx[0],idx[1]]-math.pi/2,2*math.pi)))
-                tcol.append(list(self.phi.field[idx[0],idx[1]]))
-                
-            azi=np.transpose(np.concatenate(np.array(tazi)))
-            col=np.transpose(np.concatenate(np.array(tcol)))
+                label=np.asarray(grainlist)
+            # gather the pixel of all the selected grains with one boolean mask
+            gmask=np.isin(self.grains.field,label)
+            azi=np.mod(self.phi1.field[gmask]-math.pi/2,2*math.pi)
+            col=self.phi.field[gmask]
         else:
             # compute azimuth and colatitude
             azi=np.mod(self.phi1.field.reshape((-1,1))-math.pi/2,2*math.pi)
             col=self.phi.field.reshape((-1,1))
 
         # compute [xc,yc,zc] the coordinate of the c-axis
-        xc = np.multiply(np.cos(azi),np.sin(col))
-        yc = np.multiply(np.sin(azi),np.sin(col))
-        zc = np.cos(col)
-        
-        # compute components of the orientation tensor
-        # corection vicious bug : if you are not using np.float128 sommetimes the sum is wrong (different of the loof 'for' and wrong), you need to have a better precision in your definition of a float.
-        a11 = np.float32(np.nanmean(np.float128(np.multiply(xc,xc))))
-        a22 = np.float32(np.nanmean(np.float128(np.multiply(yc,yc))))
-        a33 = np.float32(np.nanmean(np.float128(np.multiply(zc,zc))))
-        a12 = np.float32(np.nanmean(np.float128(np.multiply(xc,yc))))
-        a13 = np.float32(np.nanmean(np.float128(np.multiply(xc,zc))))
-        a23 = np.float32(np.nanmean(np.float128(np.multiply(yc,zc))))
-        
-        orientation_tensor=[a11, a12, a13],[a12, a22, a23],[a13, a23, a33]
+        # sin(col) is computed once and the products are done in place to avoid temporaries
+        sincol=np.sin(col)
+        xc=np.cos(azi)
+        xc*=sincol
+        yc=np.sin(azi)
+        yc*=sincol
+        zc=np.cos(col)
 
-        orientation_tensor=np.array(orientation_tensor)
+        # localized once the pixel without orientation, the mask is reused for the tensor and the scatter selection
+        valid=~(np.isnan(xc)|np.isnan(yc)|np.isnan(zc))
+
+        # compute components of the orientation tensor
+        # remove the NaN value once then one matrix product gives the 6 components ; np.dot uses pairwise summation in float64 so the previous np.float128 workaround is not needed anymore
+        M=np.vstack([xc[valid],yc[valid],zc[valid]])
+        orientation_tensor=np.dot(M,np.transpose(M))/np.shape(M)[1]
         # calcul eigenvalue and eigenvector
         w,v=np.linalg.eig(orientation_tensor)
         
         #compute theta and phi
         theta=np.arccos(zc)
         phi=np.arctan2(yc, xc)
-        # caculate coordinate for the pole figure
-        xx = np.multiply(2*np.sin(theta/2),np.cos(phi))
-        yy = np.multiply(2*np.sin(theta/2),np.sin(phi))
+        # caculate coordinate for the pole figure, 2*sin(theta/2) is shared between xx and yy
+        r=np.sin(theta/2)
+        r*=2
+        xx=np.cos(phi)
+        xx*=r
+        yy=np.sin(phi)
+        yy*=r
         
         if allpixel:
             rand=np.arange(np.size(xx))
@@ -459,14 +501,18 @@ class aita(object):
             # select only 10000 pixels
             rand=np.int32(np.linspace(1., np.size(xc)-1, np.size(xc)/1000))
             
-        # select phi[rand] is not an NaN value
-        rand=rand[~np.isnan(np.reshape(xx[rand],np.size(rand)))]
+        # select phi[rand] is not an NaN value (reuse the mask instead of a new isnan pass)
+        rand=rand[np.reshape(valid,np.size(valid))[rand]]
                       
         # plot pixel orientation with density color bar
         x=np.reshape(xx[rand],np.size(rand))
         y=np.reshape(yy[rand],np.size(rand))
-        xy = np.vstack([x,y])
-        z = gaussian_kde(xy)(xy)
+        # estimate the density on a grid and read it back at each point, O(N) instead of the O(N^2) gaussian_kde evaluation
+        H,xe,ye=np.histogram2d(x,y,bins=256,range=[[-1.5,1.5],[-1.5,1.5]])
+        H=scipy.ndimage.gaussian_filter(H,sigma=4)
+        ix=np.clip(np.int32((x-xe[0])/(xe[1]-xe[0])),0,255)
+        iy=np.clip(np.int32((y-ye[0])/(ye[1]-ye[0])),0,255)
+        z=H[ix,iy]
         
         idf=np.where(z>np.percentile(z, filter))
         x=x[idf]
@@ -491,7 +537,7 @@ class aita(object):
         #compute theta_e and phi_e
         if peigen:
             # to plot the pole figure here zc should be positive
-            for i in list(xrange(3)):
+            for i in range(3):
                 #test if zc is negative
                 if np.sum(v[2,i])<0:
                     # replace the vector by -vector
@@ -547,21 +593,25 @@ class aita(object):
         '''
         # size of the map
         nx=np.shape(self.phi.field)
-        # create image for color map
-        img=np.ones([nx[0],nx[1],3])
         # load the colorwheel
         rlut=lut(nx=nlut,circle=False)
         # fill the color map
         XX=(nlut-1)/2*np.multiply(np.sin(self.phi.field),np.cos(self.phi1.field))+(nlut-1)/2
         YY=(nlut-1)/2*np.multiply(np.sin(self.phi.field),np.sin(self.phi1.field))+(nlut-1)/2
-    
-        for i in list(xrange(nx[0])):
-            for j in list(xrange(nx[1])):
-                if ~np.isnan(self.phi.field[i,j]):
-                    img[i,j,0]=rlut[np.int32(XX[i,j]),np.int32(YY[i,j]),0]
-                    img[i,j,1]=rlut[np.int32(XX[i,j]),np.int32(YY[i,j]),1]
-                    img[i,j,2]=rlut[np.int32(XX[i,j]),np.int32(YY[i,j]),2]
-                
+        if numba is not None:
+            # compiled parallel per-pixel gather, no integer index maps to build
+            img=np.ones([nx[0],nx[1],3])
+            _fill_rgb(self.phi.field,XX,YY,rlut,img)
+        else:
+            # localized the pixel with an orientation
+            valid=~np.isnan(self.phi.field)
+            # cast the colorwheel coordinate (NaN pixel get a dummy index)
+            XXi=np.clip(np.int32(np.nan_to_num(XX)),0,nlut-1)
+            YYi=np.clip(np.int32(np.nan_to_num(YY)),0,nlut-1)
+            # gather the color of all the pixel in one pass and paint NaN pixel in white
+            img=rlut[XXi,YYi]
+            img[~valid]=1.
+
         h=plt.imshow(img,extent=(0,nx[1]*self.phi.res,0,nx[0]*self.phi.res))               
         
         return h,img
@@ -607,36 +657,23 @@ class aita(object):
         # numbers of pixel along the line
         nb_pixel=np.int32(np.sqrt((xx[1]-xx[0])**2+(yy[1]-yy[0])**2))
         
-        # calcul for each pixel
-        phi=[]
-        phi1=[]
-        x=[]
-        xi=[]
-        yi=[]
-        mis2p=[]
-        mis2o=[]
-        ori=[]
-        for i in list(xrange(nb_pixel)):
-            # find the coordinate x an y along the line
-            xi.append(ss[0]-np.int32(np.round(i*(xx[1]-xx[0])/nb_pixel+xx[0])))
-            yi.append(np.int32(np.round(i*(yy[1]-yy[0])/nb_pixel+yy[0])))
-            # extract phi and phi1
-            phi.append(self.phi.field[xi[i],yi[i]])
-            phi1.append(self.phi1.field[xi[i],yi[i]])
-            
-            # ori0 and orii are the c axis vector
-            ori.append(np.mat([np.cos(np.mod(phi1[i]-math.pi/2,2*math.pi))*np.sin(phi[i]) , np.sin(np.mod(phi1[i]-math.pi/2,2*math.pi))*np.sin(phi[i]) ,np.cos(phi[i])]))   
-            # mis2o is the misorientation between pixel i and the origin
-            mis2o.append(np.float(np.arccos(np.abs(ori[0]*np.transpose(ori[i])))*180/math.pi))
-            if i>0:
-            # mis2p is the misorientation to the previous pixel    
-                mis2p.append(np.float(np.arccos(np.abs(ori[i]*np.transpose(ori[i-1])))*180/math.pi))
-            # x is the position along the line
-                x.append(np.sqrt((xi[i]-xi[0])**2+(yi[i]-yi[0])**2))
-            else:
-                mis2p.append(0.0)
-                x.append(0.0)
-
+        # find the coordinate x an y along the line for all the pixel
+        t=np.arange(nb_pixel)
+        xi=ss[0]-np.int32(np.round(t*(xx[1]-xx[0])/nb_pixel+xx[0]))
+        yi=np.int32(np.round(t*(yy[1]-yy[0])/nb_pixel+yy[0]))
+        # extract phi and phi1 along the line in one pass
+        phi=self.phi.field[xi,yi]
+        phi1=self.phi1.field[xi,yi]
+        # ori is the c axis vector for each pixel along the line
+        azi=np.mod(phi1-math.pi/2,2*math.pi)
+        ori=np.transpose(np.array([np.cos(azi)*np.sin(phi),np.sin(azi)*np.sin(phi),np.cos(phi)]))
+        # mis2o is the misorientation between pixel i and the origin
+        mis2o=np.arccos(np.abs(np.dot(ori,ori[0])))*180/math.pi
+        # mis2p is the misorientation to the previous pixel
+        mis2p=np.zeros(nb_pixel)
+        mis2p[1:]=np.arccos(np.abs(np.sum(ori[1:]*ori[:-1],axis=1)))*180/math.pi
+        # x is the position along the line
+        x=np.sqrt((xi-xi[0])**2+(yi-yi[0])**2)
 
         hh=plt.figure()
         plt.subplot(211)
@@ -683,23 +720,14 @@ class aita(object):
         miny=np.int(np.fix(np.min(x[:,1])))
         maxy=np.int(np.ceil(np.max(x[:,1])))
         
-        # write all point inside this area
-        gpoint=[]
-        for i in list(xrange(minx,maxx)):
-            for j in list(xrange(miny,maxy)):
-                gpoint.append([i,j])
-        
-    
-        # test if the point is inside the triangle    
-        gIn=[]
-        for i in list(xrange(len(gpoint))):
-            gIn.append(isInsideTriangle(gpoint[i],x[0,:],x[1,:],x[2,:]))
+        # build all the point inside this area
+        ii,jj=np.mgrid[minx:maxx,miny:maxy]
+        # test all the points against the triangle in one batched call
+        gIn=isInsideTriangle(np.column_stack((ii.ravel(),jj.ravel())),x[0,:],x[1,:],x[2,:]).reshape(np.shape(ii))
 
-        gpointIn=np.array(gpoint)[np.array(gIn)]
-        
         #transform in xIn and yIn, the coordinate of the map
-        xIn=np.shape(self.grains.field)[0]-gpointIn[:,1]
-        yIn=gpointIn[:,0]
+        xIn=np.shape(self.grains.field)[0]-jj[gIn]
+        yIn=ii[gIn]
                
         # add one grains
         self.grains.field[xIn,yIn]=np.nanmax(self.grains.field)+1
@@ -722,30 +750,39 @@ class aita(object):
         con=True
         
         while con:
-            gID=self.grains.mask_build()
+            gID,glab=self.grains.mask_build()
             print('triple junction label')
             x=input()
             ng=(self.grains*gID).field
-            ngmax=np.nanmax(ng)
-            for i in list(xrange(np.int32(ngmax))):
-                id=np.where(self.grains.field==i)
+            # the NaN check in nanmax costs a branch per element : only pay it for float label maps
+            if np.issubdtype(ng.dtype,np.floating):
+                ngmax=int(np.nanmax(ng))
+            else:
+                ngmax=int(ng.max(initial=0))
+            # bucket the pixel of each grain with one stable argsort instead of one full np.where scan per grain (NaN sort at the end)
+            g=self.grains.field.ravel()
+            order=np.argsort(g,kind='stable')
+            sorted_g=g[order]
+            boundaries=np.searchsorted(sorted_g,np.arange(ngmax+1))
+            for i in range(ngmax):
+                id=np.unravel_index(order[boundaries[i]:boundaries[i+1]],np.shape(self.grains.field))
                 if len(id[0])>0:
                     if mean:
-                        pp=np.array([[id[0][0],id[1][0]]])
-                        phi1,pos=self.phi1.extract_data(pos=pp)
-                        phi,pos=self.phi.extract_data(pos=pp)
-                        if ~np.isnan(phi1):
-                            res.append([i,phi1,phi,float(x)])
+                        # only the first pixel of the grain
+                        rows=id[0][:1]
+                        cols=id[1][:1]
                     else:
-                        for j in list(xrange(len(id[0]))):
-                            pp=np.array([[id[0][j],id[1][j]]])
-                            phi1,pos=self.phi1.extract_data(pos=pp)
-                            phi,pos=self.phi.extract_data(pos=pp)
-                            if ~np.isnan(phi1):
-                                res.append([i,phi1,phi,float(x)])
+                        rows=id[0]
+                        cols=id[1]
+                    # one vectorized fetch replaces the per-pixel extract_data round trips (same transposed indexing as extract_data)
+                    phi1_all=self.phi1.field[cols,rows]
+                    phi_all=self.phi.field[cols,rows]
+                    valid=~np.isnan(phi1_all)
+                    for phi1_v,phi_v in zip(phi1_all[valid],phi_all[valid]):
+                        res.append([i,phi1_v,phi_v,float(x)])
                             
             print('continue ? 0 no, 1 yes')
-            con=input()
+            con=int(input())
         
         return res
             
@@ -754,28 +791,88 @@ class aita(object):
 ###################### Function need for aita class  #####################
 ##########################################################################        
         
-def cart2pol(x, y):
+def cart2pol(x, y, out_rho=None, out_phi=None):
     '''
     Convert cartesien coordinate x,y into polar coordinate rho, theta
-    
-    :param x: x cartesian coordinate
+
+    :param x: x cartesian coordinate (scalar or array, inputs broadcast as a ufunc)
     :param y: y cartesian coordinate
-    :type x: float
-    :type y: float
+    :type x: float or np.array
+    :type y: float or np.array
+    :param out_rho: optional output array for the radius (avoid an allocation)
+    :param out_phi: optional output array for the angle
     :return: rho (radius), theta (angle)
-    :rtype: float
+    :rtype: float or np.array
     :Exemple: >>> rho,theta=cart2pol(x,y)
     '''
     # transform cartesien to polar coordinate
-    rho = np.sqrt(x**2 + y**2)
-    phi = np.arctan2(y, x)
+    # np.hypot does one pass over memory (no x**2+y**2 temporaries) and is overflow safe
+    rho = np.hypot(x, y, out=out_rho)
+    phi = np.arctan2(y, x, out=out_phi)
     return(rho, phi)
 
 
+if numba is not None:
+    @numba.njit(parallel=True)
+    def _hsv2rgb_lut(h,v,out):
+        '''
+        Compiled pixel-wise HSV->RGB conversion with saturation 1, used by lut when numba is available
+        '''
+        for i in numba.prange(out.shape[0]):
+            for j in range(out.shape[1]):
+                H6=6.0*h[i,j]
+                k=int(H6)%6
+                f=H6-int(H6)
+                V=v[i,j]
+                q=V*(1.0-f)
+                t=V*f
+                if k==0:
+                    out[i,j,0]=V
+                    out[i,j,1]=t
+                    out[i,j,2]=0.
+                elif k==1:
+                    out[i,j,0]=q
+                    out[i,j,1]=V
+                    out[i,j,2]=0.
+                elif k==2:
+                    out[i,j,0]=0.
+                    out[i,j,1]=V
+                    out[i,j,2]=t
+                elif k==3:
+                    out[i,j,0]=0.
+                    out[i,j,1]=q
+                    out[i,j,2]=V
+                elif k==4:
+                    out[i,j,0]=t
+                    out[i,j,1]=0.
+                    out[i,j,2]=V
+                else:
+                    out[i,j,0]=V
+                    out[i,j,1]=0.
+                    out[i,j,2]=q
+
+    @numba.njit(parallel=True)
+    def _fill_rgb(phi,XX,YY,rlut,out):
+        '''
+        Compiled per-pixel gather of the colormap, used by aita.plot when numba is available
+        '''
+        for i in numba.prange(out.shape[0]):
+            for j in range(out.shape[1]):
+                if not math.isnan(phi[i,j]):
+                    x=int(XX[i,j])
+                    y=int(YY[i,j])
+                    out[i,j,0]=rlut[x,y,0]
+                    out[i,j,1]=rlut[x,y,1]
+                    out[i,j,2]=rlut[x,y,2]
+
+
+@functools.lru_cache(maxsize=8)
 def lut(nx=512,circle=True):
     '''
     Create a 2D colorwheel
-    
+
+    The result only depends on (nx,circle) so it is memoized, building the colorwheel once per size.
+
     :param nx: number of pixel for the colorwheel
     :param circle: do you want create a black circle around
     :type nx: int
@@ -787,35 +884,41 @@ def lut(nx=512,circle=True):
         >>> plt.imshow(lut)
         >>> plt.show()
     '''
-    x=np.linspace(-math.pi/2, math.pi/2, nx)
-    y=np.linspace(-math.pi/2, math.pi/2, nx)
-    xv, yv = np.meshgrid(x, y)
+    # float32 is plenty for a display lookup table and halves the bytes moved
+    x=np.linspace(-math.pi/2, math.pi/2, nx, dtype=np.float32)
+    y=np.linspace(-math.pi/2, math.pi/2, nx, dtype=np.float32)
+    # sparse grid : the cart2pol ufuncs broadcast the (1,nx) and (nx,1) vectors, no full coordinate grids materialized
+    xv, yv = np.meshgrid(x, y, sparse=True, copy=False)
     rho,phi=cart2pol(xv, yv)
     h = (phi-np.min(phi))/(np.max(phi)-np.min(phi))
     #print(h)
     v = rho/np.max(rho)
-    # lut=[h,s,v]
-    # colorwheel hsv
-    luthsv = np.ones((nx, nx,3))
-    luthsv[:,:,0]=h
-    luthsv[:,:,2]=v
-    # colorwheel rgb
-    lutrgb = np.ones((nx, nx,3))
-    for i in list(xrange(nx)):
-        for j in list(xrange(nx)):
-            lutrgb[i,j,0],lutrgb[i,j,1],lutrgb[i,j,2]=colorsys.hsv_to_rgb(luthsv[i,j,0],luthsv[i,j,1],luthsv[i,j,2])
+    # colorwheel rgb : keep h and v as separate channels (the saturation is constant 1), the (nx,nx,3) HSV array is only assembled when the vectorized converter needs it
+    if numba is not None:
+        # compiled parallel pixel-wise conversion
+        lutrgb=np.empty((nx, nx,3),dtype=np.float32)
+        _hsv2rgb_lut(h,v,lutrgb)
+    else:
+        # one vectorized HSV->RGB conversion over the whole grid, np.empty avoid the useless fill-with-one pass
+        luthsv = np.empty((nx, nx,3),dtype=np.float32)
+        luthsv[:,:,0]=h
+        luthsv[:,:,1]=1.
+        luthsv[:,:,2]=v
+        lutrgb = hsv_to_rgb(luthsv)
 
-        
-    # build a circle color bar        
+
+    # build a circle color bar : run the disk test and the zeroing by row tiles so each tile stays cache resident and the full nx*nx mask is never materialized
     if circle:
-        for i in list(xrange(nx)):
-            for j in list(xrange(nx)):
-                if ((i-nx/2)**2+(j-nx/2)**2)**0.5>(nx/2):
-                    lutrgb[i,j,0]=0 
-                    lutrgb[i,j,1]=0
-                    lutrgb[i,j,2]=0
-                    
+        xx=np.arange(nx)
+        r2=(nx/2)**2
+        tile=64
+        for i0 in range(0,nx,tile):
+            yy=np.arange(i0,min(i0+tile,nx)).reshape(-1,1)
+            mask=(xx-nx/2)**2+(yy-nx/2)**2>r2
+            lutrgb[i0:i0+tile][mask]=0
 
+    # the array is cached : return it read-only so a caller cannot corrupt the cache
+    lutrgb.setflags(write=False)
 
     return lutrgb
     
@@ -824,7 +927,7 @@ def isInsideTriangle(P,p1,p2,p3): #is P inside triangle made by p1,p2,p3?
     '''
     test if P is inside the triangle define by p1 p2 p3
     
-    :param P: point you want test
+    :param P: point you want test, one point [x,y] or an array of points of shape (N,2)
     :param p1: one submit of the triangle
     :param p2: one submit of the triangle
     :param p3: one submit of the triangle
@@ -832,16 +935,21 @@ def isInsideTriangle(P,p1,p2,p3): #is P inside triangle made by p1,p2,p3?
     :type p1: array
     :type p2: array
     :type p3: array
-    :return: isIn
-    :rtype: bool
+    :return: isIn (one bool for one point, an array of bool for (N,2) input)
+    :rtype: bool or np.array
     :Exemple:
         >>> isInsideTriangle([0,0],[-1,0],[0,1],[1,0])
         >>> isInsideTriangle([0,-0.1],[-1,0],[0,1],[1,0])
     '''
-    x,x1,x2,x3 = P[0],p1[0],p2[0],p3[0]
-    y,y1,y2,y3 = P[1],p1[1],p2[1],p3[1]
-    full = abs (x1 * (y2 - y3) + x2 * (y3 - y1) + x3 * (y1 - y2))
-    first = abs (x1 * (y2 - y) + x2 * (y - y1) + x * (y1 - y2))
-    second = abs (x1 * (y - y3) + x * (y3 - y1) + x3 * (y1 - y))
-    third = abs (x * (y2 - y3) + x2 * (y3 - y) + x3 * (y - y2))
-    return abs(first + second + third - full) < .0000001
+    P=np.atleast_2d(P)
+    x,x1,x2,x3 = P[:,0],p1[0],p2[0],p3[0]
+    y,y1,y2,y3 = P[:,1],p1[1],p2[1],p3[1]
+    # barycentric coordinate (u,v) of P by Cramer's rule : no scale dependent epsilon
+    d=(x2-x1)*(y3-y1)-(x3-x1)*(y2-y1)
+    u=((x-x1)*(y3-y1)-(x3-x1)*(y-y1))/d
+    v=((x2-x1)*(y-y1)-(x-x1)*(y2-y1))/d
+    # P is inside when both coordinates are positive and their sum lower than one
+    isIn=(u>=0)&(v>=0)&(u+v<=1)
+    if np.size(isIn)==1:
+        return bool(isIn[0])
+    return isIn
@@ -98,8 +98,8 @@ class image2d(object):
         ss=np.shape(self.field)
         triple=[]
         pos=[]
-        for i in list(xrange(ss[0]-2)):
-            for j in list(xrange(ss[1]-2)):
+        for i in range(ss[0]-2):
+            for j in range(ss[1]-2):
                 sub=self.field[i:i+2,j:j+2]
                 id=np.where(sub[:]==sub[0,0])
                 i1=len((id[0]))
@@ -328,8 +328,8 @@ class image2d(object):
         micro_out.write('POINT_DATA ' + str(ss[0]*ss[1]) + '\n')
         micro_out.write('SCALARS scalars float \n')
         micro_out.write('LOOKUP_TABLE default \n')
-        for i in list(xrange(ss[0]))[::-1]:
-            for j in list(xrange(ss[1])):
+        for i in range(ss[0])[::-1]:
+            for j in range(ss[1]):
                 micro_out.write(str(int(self.field[i][j]))+' ')
             micro_out.write('\n')
         
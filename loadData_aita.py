@@ -1,8 +1,35 @@
 import aita
+import itertools
 import numpy as np
 import math
+import re
 from skimage import io
 
+# compiled once : first integer of a header field
+_HEADER_INT=re.compile(r'(\d+)')
+
+# angle conversion constants, hoisted once for the parse hot path
+_DEG2RAD=math.pi/180.
+_TAU=math.tau
+
+def _header_int(line,start,stop):
+    '''
+    Parse an integer header field : first integer found from the field offset, with the fixed-width slice as fallback
+
+    :param line: header line
+    :type line: str
+    :param start: offset where the field begins
+    :type start: int
+    :param stop: offset where the fixed-width field ends
+    :type stop: int
+    :return: field value
+    :rtype: int
+    '''
+    m=_HEADER_INT.search(line,start)
+    if m:
+        return int(m.group(1))
+    return int(line[start:stop])
+
 def aita5col(data_adress,micro_adress=0):
     '''
     Function to open data from AITA analyser using 'cistodat' which give output file with 5 column (x,y,azi,col,qua)
@@ -14,37 +41,41 @@ def aita5col(data_adress,micro_adress=0):
     :return: aita object
     :rtype: aita
     '''
-    # load data from G50 output
-    file=open(data_adress,'r')
-    azi,col,qua = np.loadtxt(file, skiprows=19,usecols=(2,3,5),dtype='f,f,f',comments='[eof]',unpack=True)    
-    file.close()
-    # read head of file
-    file=open(data_adress,'r')
-    a=[]
-    [a.append(file.readline()) for i in list(xrange(16))]
-    file.close()
+    # read head of file then load data from G50 output with the same open
+    with open(data_adress,'r') as file:
+        a=list(itertools.islice(file,19))
+        # a plain float32 2D array avoid the record array build and split of the 'f,f,f' dtype
+        data=np.loadtxt(file,usecols=(2,3,5),dtype=np.float32,comments='[eof]')
+    azi=data[:,0]
+    col=data[:,1]
+    qua=data[:,2]
     # resolution mu m
-    res=int(a[5][10:12])
+    res=_header_int(a[5],10,12)
     # transforme the resolution in mm
-    resolution=res/1000. 
+    resolution=res/1000.
     # number of pixel along x
-    nx=int(a[14][9:13])
+    nx=_header_int(a[14],9,13)
     # number of pixel along y
-    ny=int(a[15][9:13])
+    ny=_header_int(a[15],9,13)
     
     # reashape the vector to a matrix
-    # use Bunge Euler angle convention
-    phi1_field=np.mod((azi.reshape((ny,nx))+90)*math.pi/180,2*math.pi)
-    phi_field=col.reshape((ny,nx))*math.pi/180
+    # use Bunge Euler angle convention, the conversion runs in place on the reshaped views (no intermediate array)
+    phi1_field=azi.reshape((ny,nx))
+    phi1_field+=90
+    phi1_field*=_DEG2RAD
+    np.mod(phi1_field,_TAU,out=phi1_field)
+    phi_field=col.reshape((ny,nx))
+    phi_field*=_DEG2RAD
     qua_field=qua.reshape((ny,nx))
     
     #open micro.bmp if necessary
     if micro_adress==0:
-        micro_field=np.zeros((ny,nx))
+        micro_field=np.zeros((ny,nx),dtype=np.float32)
     else:
         micro_bmp = io.imread(micro_adress)
         mm=np.max(micro_bmp)
-        micro_field=micro_bmp[:,:,0]/mm
+        # normalize in float32, the uint8/int division promoted the whole map to float64
+        micro_field=np.float32(micro_bmp[:,:,0])/np.float32(mm)
         
     return aita.aita(phi1_field,phi_field,qua_field,micro_field,resolution=resolution)
 
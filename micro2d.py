@@ -15,7 +15,6 @@ import matplotlib.cm as cm
 import numpy as np
 from skimage import morphology
 import scipy
-from IPython.utils.py3compat import xrange
 
 class micro2d(im2d.image2d):
     '''
@@ -41,16 +40,22 @@ class micro2d(im2d.image2d):
         return
     
     
-    def grain_label(self):
+    def grain_label(self,boundary_nan=False):
         '''
         Label area in a black and white picture
-        
+
+        :param boundary_nan: replace the label by NaN on the boundary pixels (avoid a second scan of the map in the caller)
+        :type boundary_nan: bool
+
         .. note:: black color for the background and white color for the boundary
         '''
         # function which label a microstructure skeleton in one number per grain
         new_img=self.field
         res=self.res
         new_grain = morphology.label(new_img, neighbors=4, background=1)
+        if boundary_nan:
+            new_grain=np.array(new_grain,float)
+            new_grain[new_img==1]=np.nan
         grains=im2d.image2d(new_grain,res)
         return grains
     
@@ -93,7 +98,7 @@ class micro2d(im2d.image2d):
         
         g_area=np.zeros(np.max(g_map.field))
         
-        for i in list(xrange(np.size(g_area))):
+        for i in range(np.size(g_area)):
             g_area[i]=np.size(np.where(g_map.field==i))*g_map.res**2.
             
         return g_area
\ No newline at end of file